@@ -18,6 +18,15 @@ class CreateAPIKeyResponse(BaseModel):
     api_key: str
 
 
+class RevokeAPIKeyRequest(BaseModel):
+    api_key: str = Field(min_length=10)
+
+
+class RevokeAPIKeyResponse(BaseModel):
+    key_prefix: str
+    revoked: bool
+
+
 class UsageSummaryResponse(BaseModel):
     account_name: str
     plan: str
@@ -1,27 +1,80 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import codecs
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
-from fastapi.responses import Response
+import orjson
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, Response
+from jinja2 import Template
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-from app.api.admin_schemas import CreateAPIKeyRequest, CreateAPIKeyResponse, UsageSummaryResponse
-from app.api.security import AuthContext, require_admin_token, require_api_key
+from app.api.admin_schemas import (
+    CreateAPIKeyRequest,
+    CreateAPIKeyResponse,
+    RevokeAPIKeyRequest,
+    RevokeAPIKeyResponse,
+    UsageSummaryResponse,
+)
+from app.api.security import (
+    AuthContext,
+    invalidate_api_key_cache,
+    require_admin_token,
+    require_api_key,
+)
+from app.paths import TEMPLATE_DIR
 from app.services.billing_store import (
     DEFAULT_PLAN_QUOTAS,
     create_api_key_for_account,
+    flush_usage_events,
     get_usage_summary_for_month,
-    log_usage_event,
     lookup_api_key,
+    record_usage_event,
+    revoke_api_key,
+)
+from app.services.pdf_cache import MemoryPDFCache, PDFCache
+from app.services.pdf_service import (
+    PDFGenerationError,
+    PDFService,
+    TemplateRenderError,
+    WaitUntil,
 )
-from app.services.pdf_service import PDFGenerationError, PDFService, TemplateRenderError
+
+MAX_UPLOAD_BYTES = int(os.getenv("PDF_API_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_TOTAL_UPLOAD_BYTES = int(os.getenv("PDF_API_MAX_TOTAL_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Starlette keeps uploads up to 1 MiB in memory, so these are read in a single call.
+SMALL_UPLOAD_BYTES = 1024 * 1024
+TEMPLATE_CACHE_MAXSIZE = 256
+ALLOWED_UPLOAD_SUFFIXES: dict[str, tuple[str, ...]] = {
+    "html_file": (".html", ".htm"),
+    "template_file": (".html", ".htm", ".j2", ".jinja", ".jinja2"),
+    "css_file": (".css",),
+    "data_file": (".json",),
+}
 
 router = APIRouter()
-template_dir = Path(__file__).resolve().parents[1] / "templates"
-pdf_service = PDFService(template_dir=template_dir)
+pdf_service = PDFService(
+    template_dir=TEMPLATE_DIR,
+    max_concurrency=int(os.getenv("PDF_API_BROWSER_POOL_SIZE", "4")),
+)
+pdf_cache = PDFCache.from_env()
+pdf_memory_cache = MemoryPDFCache.from_env()
+_template_cache: OrderedDict[bytes, Template] = OrderedDict()
+# Compiles run in worker threads, so the LRU bookkeeping needs a real lock.
+_template_cache_lock = threading.Lock()
+# One lock per digest being rendered; entries disappear once no request holds them.
+_render_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
 
 
 @router.get("/health", tags=["System"], summary="Health check")
@@ -29,21 +82,114 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
-async def _read_text_upload(file: UploadFile, field_name: str) -> str:
+def _upload_too_large(field_name: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"'{field_name}' exceeds the {MAX_UPLOAD_BYTES} byte upload limit.",
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """Reject ``POST /generate`` bodies declared larger than the upload limit.
+
+    This has to run as middleware: by the time the endpoint sees the request, FastAPI has
+    already spooled the whole multipart body to parse the form.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/generate":
+            content_length = Headers(scope=scope).get("content-length")
+            if (
+                content_length
+                and content_length.isdigit()
+                and int(content_length) > MAX_TOTAL_UPLOAD_BYTES
+            ):
+                detail = f"Request body exceeds the {MAX_TOTAL_UPLOAD_BYTES} byte upload limit."
+                response = JSONResponse(status_code=413, content={"detail": detail})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def _validate_uploads(uploads: dict[str, UploadFile | None]) -> None:
+    """Reject oversized or obviously mistyped uploads before any of them is read."""
+    total_bytes = 0
+    for field_name, file in uploads.items():
+        if file is None:
+            continue
+        suffix = Path(file.filename or "").suffix.lower()
+        if suffix and suffix not in ALLOWED_UPLOAD_SUFFIXES[field_name]:
+            allowed = ", ".join(ALLOWED_UPLOAD_SUFFIXES[field_name])
+            raise HTTPException(
+                status_code=422, detail=f"'{field_name}' must be one of: {allowed}."
+            )
+        total_bytes += file.size or 0
+
+    if total_bytes > MAX_TOTAL_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Uploaded files exceed the {MAX_TOTAL_UPLOAD_BYTES} byte upload limit.",
+        )
+
+
+async def _read_small_upload(file: UploadFile, field_name: str) -> bytes | None:
+    """Read a small upload of known size in one call; ``None`` means it should be streamed."""
+    if file.size is None or file.size > SMALL_UPLOAD_BYTES:
+        return None
+    if file.size > MAX_UPLOAD_BYTES:
+        raise _upload_too_large(field_name)
     raw = await file.read()
     if not raw:
         raise HTTPException(status_code=422, detail=f"'{field_name}' must not be empty.")
+    return raw
+
+
+async def _iter_upload_chunks(file: UploadFile, field_name: str) -> AsyncIterator[bytes]:
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _upload_too_large(field_name)
+
+    total_bytes = 0
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        total_bytes += len(chunk)
+        if total_bytes > MAX_UPLOAD_BYTES:
+            raise _upload_too_large(field_name)
+        yield chunk
+
+    if total_bytes == 0:
+        raise HTTPException(status_code=422, detail=f"'{field_name}' must not be empty.")
+
+
+async def _read_text_upload(file: UploadFile, field_name: str) -> str:
+    raw = await _read_small_upload(file, field_name)
+    if raw is not None:
+        try:
+            return raw.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            raise HTTPException(
+                status_code=422, detail=f"'{field_name}' must be UTF-8 text."
+            ) from exc
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts: list[str] = []
     try:
-        return raw.decode("utf-8")
+        async for chunk in _iter_upload_chunks(file, field_name):
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
     except UnicodeDecodeError as exc:
         raise HTTPException(status_code=422, detail=f"'{field_name}' must be UTF-8 text.") from exc
+    return "".join(parts)
 
 
 async def _read_json_object_upload(file: UploadFile) -> dict[str, Any]:
-    raw_json = await _read_text_upload(file, "data_file")
+    raw_json = await _read_small_upload(file, "data_file")
+    if raw_json is None:
+        raw_json = b"".join([chunk async for chunk in _iter_upload_chunks(file, "data_file")])
     try:
-        parsed = json.loads(raw_json)
-    except json.JSONDecodeError as exc:
+        parsed = orjson.loads(raw_json)
+    except orjson.JSONDecodeError as exc:
         raise HTTPException(status_code=422, detail="'data_file' must contain valid JSON.") from exc
 
     if not isinstance(parsed, dict):
@@ -51,6 +197,96 @@ async def _read_json_object_upload(file: UploadFile) -> dict[str, Any]:
     return parsed
 
 
+def _compile_template_cached(template_text: str) -> Template:
+    """Compile an uploaded template, reusing the result for byte-identical uploads."""
+    digest = hashlib.blake2b(template_text.encode("utf-8"), digest_size=16).digest()
+    with _template_cache_lock:
+        template = _template_cache.get(digest)
+        if template is not None:
+            _template_cache.move_to_end(digest)
+            return template
+
+    # Compile outside the lock; two threads racing on the same upload just compile it twice.
+    template = pdf_service.compile_template(template_text)
+    with _template_cache_lock:
+        _template_cache[digest] = template
+        if len(_template_cache) > TEMPLATE_CACHE_MAXSIZE:
+            _template_cache.popitem(last=False)
+    return template
+
+
+def _render_uploaded_template(template_text: str, css: str | None, data: dict[str, Any]) -> str:
+    """Compile (or reuse) an uploaded template and render it; meant to run in a worker thread."""
+    return pdf_service.render_template_content(
+        compiled_template=_compile_template_cached(template_text), css=css, data=data
+    )
+
+
+def _render_digest(
+    *,
+    account_id: int,
+    request_mode: str,
+    source: str,
+    css: str | None,
+    data: dict[str, Any] | None,
+    wait_until: WaitUntil = "load",
+) -> str:
+    """Hash the render inputs; JSON data is canonicalised so key order does not matter.
+
+    The account is part of the key so one tenant's cache hits reveal nothing about another's.
+    """
+    parts = (
+        str(account_id).encode("utf-8"),
+        request_mode.encode("utf-8"),
+        wait_until.encode("utf-8"),
+        source.encode("utf-8"),
+        (css or "").encode("utf-8"),
+        orjson.dumps(data, option=orjson.OPT_SORT_KEYS) if data is not None else b"",
+    )
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(len(part).to_bytes(8, "big"))
+        hasher.update(part)
+    return hasher.hexdigest()
+
+
+async def _cached_render(
+    digest: str, render: Callable[[], Awaitable[bytes]]
+) -> tuple[str, bytes, tuple[Path, int] | None]:
+    """Return (X-Cache status, PDF bytes, cached file).
+
+    Concurrent misses for the same digest share a single render.
+    """
+    pdf_bytes = pdf_memory_cache.get(digest)
+    if pdf_bytes is not None:
+        return "HIT", pdf_bytes, None
+    cached = await asyncio.to_thread(pdf_cache.lookup, digest)
+    if cached is not None:
+        return "HIT", b"", cached
+
+    lock = _render_locks.get(digest)
+    if lock is None:
+        lock = _render_locks[digest] = asyncio.Lock()
+    async with lock:
+        pdf_bytes = pdf_memory_cache.get(digest)
+        if pdf_bytes is not None:
+            return "HIT", pdf_bytes, None
+        cached = await asyncio.to_thread(pdf_cache.lookup, digest)
+        if cached is not None:
+            return "HIT", b"", cached
+        pdf_bytes = await render()
+        pdf_memory_cache.put(digest, pdf_bytes)
+        await asyncio.to_thread(pdf_cache.put, digest, pdf_bytes)
+        return "MISS", pdf_bytes, None
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = (candidate.strip().removeprefix("W/") for candidate in if_none_match.split(","))
+    return any(candidate == etag for candidate in candidates)
+
+
 def _parse_month_start_utc(month: str | None) -> datetime:
     if month is None:
         now_utc = datetime.now(timezone.utc)
@@ -72,14 +308,18 @@ def _parse_month_start_utc(month: str | None) -> datetime:
     ),
     responses={
         200: {"description": "PDF generated successfully"},
+        304: {"description": "PDF matching If-None-Match is unchanged"},
         401: {"description": "Missing or invalid API key"},
         403: {"description": "Inactive API key"},
+        412: {"description": "If-None-Match: * sent (a POST never matches it)"},
+        413: {"description": "Uploaded file too large"},
         429: {"description": "Monthly quota exceeded"},
         422: {"description": "Validation error"},
         500: {"description": "PDF generation failed"},
     },
 )
 async def generate_pdf(
+    request: Request,
     html_file: UploadFile | None = File(
         default=None, description="Raw HTML file (.html). Use this OR template_file."
     ),
@@ -91,6 +331,13 @@ async def generate_pdf(
         default=None, description="Optional JSON data file for template rendering."
     ),
     filename: str | None = Form(default=None, description="Output filename."),
+    wait_until: WaitUntil = Form(
+        default="load",
+        description=(
+            "Page load event to wait for before printing. Use 'networkidle' when the HTML "
+            "pulls remote images or web fonts."
+        ),
+    ),
     auth: AuthContext = Depends(require_api_key),
 ) -> Response:
     request_mode = (
@@ -98,7 +345,10 @@ async def generate_pdf(
     )
     status_code = 200
     pdf_bytes = b""
+    pdf_size = 0
+    cached_path: Path | None = None
     success = False
+    cache_status = "MISS"
 
     try:
         has_html_file = html_file is not None
@@ -109,6 +359,22 @@ async def generate_pdf(
                 status_code=422, detail="Provide exactly one of 'html_file' or 'template_file'."
             )
 
+        _validate_uploads(
+            {
+                "html_file": html_file,
+                "template_file": template_file,
+                "css_file": css_file,
+                "data_file": data_file,
+            },
+        )
+
+        # RFC 9110: "*" asks to proceed only if nothing exists yet, which a render can't promise.
+        if (request.headers.get("if-none-match") or "").strip() == "*":
+            status_code = 412
+            raise HTTPException(
+                status_code=412, detail="If-None-Match: * is not supported; send a previous ETag."
+            )
+
         if auth.successful_requests_this_month >= auth.record.monthly_quota:
             status_code = 429
             raise HTTPException(
@@ -120,24 +386,49 @@ async def generate_pdf(
             )
 
         css_text = await _read_text_upload(css_file, "css_file") if css_file is not None else None
+        data: dict[str, Any] | None = None
         if html_file is not None:
-            html_text = await _read_text_upload(html_file, "html_file")
-            rendered_html = pdf_service.build_html(
-                html=html_text,
-                css=css_text,
-                template_name=None,
-                data=None,
-            )
+            source_text = await _read_text_upload(html_file, "html_file")
         else:
-            template_text = await _read_text_upload(template_file, "template_file")
+            source_text = await _read_text_upload(template_file, "template_file")
             data = await _read_json_object_upload(data_file) if data_file is not None else {}
-            rendered_html = pdf_service.render_template_content(
-                template_content=template_text,
-                css=css_text,
-                data=data,
-            )
 
-        pdf_bytes = await pdf_service.generate_pdf(rendered_html)
+        digest = _render_digest(
+            account_id=auth.record.account_id,
+            request_mode=request_mode,
+            source=source_text,
+            css=css_text,
+            data=data,
+            wait_until=wait_until,
+        )
+        etag = f'"{digest}"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            cache_status = "HIT"
+            success = True
+            status_code = 304
+            return Response(status_code=304, headers={"ETag": etag, "X-Cache": cache_status})
+
+        async def render() -> bytes:
+            # Jinja compilation, rendering and CSS injection are CPU-bound; keep them off the loop.
+            if data is None:
+                rendered_html = await asyncio.to_thread(
+                    pdf_service.build_html,
+                    html=source_text,
+                    css=css_text,
+                    template_name=None,
+                    data=None,
+                )
+            else:
+                rendered_html = await asyncio.to_thread(
+                    _render_uploaded_template, source_text, css_text, data
+                )
+            return await pdf_service.generate_pdf(rendered_html, wait_until=wait_until)
+
+        cache_status, pdf_bytes, cached = await _cached_render(digest, render)
+        if cached is not None:
+            cached_path, pdf_size = cached
+        else:
+            pdf_size = len(pdf_bytes)
         success = True
         status_code = 200
     except TemplateRenderError as exc:
@@ -150,23 +441,27 @@ async def generate_pdf(
         status_code = exc.status_code
         raise
     finally:
-        log_usage_event(
+        await record_usage_event(
             api_key_id=auth.record.api_key_id,
             account_id=auth.record.account_id,
             request_mode=request_mode,
             success=success,
             status_code=status_code,
-            pdf_bytes=len(pdf_bytes),
+            pdf_bytes=pdf_size,
         )
 
     output_filename = (filename or "generated.pdf").strip()
     if not output_filename.endswith(".pdf"):
         output_filename = f"{output_filename}.pdf"
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{output_filename}"'},
-    )
+    headers = {
+        "Content-Disposition": f'attachment; filename="{output_filename}"',
+        "ETag": etag,
+        "X-Cache": cache_status,
+    }
+    if cached_path is not None:
+        # Cache hits are sent from disk in chunks rather than read into memory first.
+        return FileResponse(cached_path, media_type="application/pdf", headers=headers)
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
 
 @router.post(
@@ -180,11 +475,13 @@ async def generate_pdf(
 async def create_api_key(
     payload: CreateAPIKeyRequest, _: str = Depends(require_admin_token)
 ) -> CreateAPIKeyResponse:
-    raw_api_key = create_api_key_for_account(
+    raw_api_key = await asyncio.to_thread(
+        create_api_key_for_account,
         account_name=payload.account_name,
         plan=payload.plan,
         monthly_quota=payload.monthly_quota,
     )
+    invalidate_api_key_cache(raw_api_key)
     resolved_quota = (
         payload.monthly_quota
         if payload.monthly_quota is not None
@@ -198,6 +495,29 @@ async def create_api_key(
     )
 
 
+@router.post(
+    "/admin/api-keys/revoke",
+    tags=["Admin"],
+    summary="Revoke API key",
+    description="Deactivate an API key so it can no longer generate PDFs.",
+    response_model=RevokeAPIKeyResponse,
+    responses={
+        401: {"description": "Invalid admin token"},
+        404: {"description": "API key not found"},
+    },
+)
+async def revoke_api_key_route(
+    payload: RevokeAPIKeyRequest, _: str = Depends(require_admin_token)
+) -> RevokeAPIKeyResponse:
+    record = await asyncio.to_thread(lookup_api_key, payload.api_key)
+    if record is None:
+        raise HTTPException(status_code=404, detail="API key not found.")
+
+    revoked = await asyncio.to_thread(revoke_api_key, payload.api_key)
+    invalidate_api_key_cache(payload.api_key)
+    return RevokeAPIKeyResponse(key_prefix=record.key_prefix, revoked=revoked)
+
+
 @router.get(
     "/admin/usage",
     tags=["Admin"],
@@ -216,13 +536,14 @@ async def get_usage_summary(
     ),
     _: str = Depends(require_admin_token),
 ) -> UsageSummaryResponse:
-    record = lookup_api_key(api_key)
+    record = await asyncio.to_thread(lookup_api_key, api_key)
     if record is None:
         raise HTTPException(status_code=404, detail="API key not found.")
 
     month_start_utc = _parse_month_start_utc(month)
-    summary = get_usage_summary_for_month(
-        account_id=record.account_id, month_start_utc=month_start_utc
+    await flush_usage_events()
+    summary = await asyncio.to_thread(
+        get_usage_summary_for_month, account_id=record.account_id, month_start_utc=month_start_utc
     )
 
     return UsageSummaryResponse(
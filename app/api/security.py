@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import asyncio
+import hmac
 import os
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timezone
 
@@ -9,15 +14,27 @@ from fastapi.security import APIKeyHeader
 
 from app.services.billing_store import (
     APIKeyRecord,
-    count_successful_usage_for_month,
+    _hash_api_key,
+    get_monthly_success_count,
     lookup_api_key,
+    peek_monthly_success_count,
 )
 
+API_KEY_CACHE_MAXSIZE = 1024
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("PDF_API_KEY_CACHE_TTL", "60"))
+
 api_key_header = APIKeyHeader(name="X-API-Key", scheme_name="ApiKeyAuth", auto_error=False)
 admin_token_header = APIKeyHeader(
     name="X-Admin-Token", scheme_name="AdminTokenAuth", auto_error=False
 )
 
+# Only found keys are cached: random probes never repeat, so caching misses would only evict
+# real keys.
+_api_key_cache: OrderedDict[str, tuple[APIKeyRecord, float]] = OrderedDict()
+_api_key_cache_lock = threading.Lock()
+_month_start_cache: tuple[int, int, datetime] | None = None
+_admin_token = os.getenv("PDF_API_ADMIN_TOKEN", "dev-admin-token").encode("utf-8")
+
 
 @dataclass(frozen=True)
 class AuthContext:
@@ -26,14 +43,62 @@ class AuthContext:
     month_start_utc: datetime
 
 
-def require_api_key(api_key: str | None = Security(api_key_header)) -> AuthContext:
+async def _lookup_api_key_cached(raw_api_key: str) -> APIKeyRecord | None:
+    if API_KEY_CACHE_TTL_SECONDS <= 0:
+        return await asyncio.to_thread(lookup_api_key, raw_api_key)
+
+    key_hash = _hash_api_key(raw_api_key)
+    now = time.monotonic()
+    with _api_key_cache_lock:
+        cached = _api_key_cache.get(key_hash)
+        if cached is not None:
+            record, expires_at = cached
+            if expires_at > now:
+                _api_key_cache.move_to_end(key_hash)
+                return record
+            del _api_key_cache[key_hash]
+
+    record = await asyncio.to_thread(lookup_api_key, raw_api_key)
+    if record is None:
+        return None
+    with _api_key_cache_lock:
+        _api_key_cache[key_hash] = (record, now + API_KEY_CACHE_TTL_SECONDS)
+        _api_key_cache.move_to_end(key_hash)
+        while len(_api_key_cache) > API_KEY_CACHE_MAXSIZE:
+            _api_key_cache.popitem(last=False)
+    return record
+
+
+def _current_month_start_utc() -> datetime:
+    """Return the start of the current UTC month, rebuilt only when the month changes."""
+    global _month_start_cache
+    now_utc = datetime.now(timezone.utc)
+    cached = _month_start_cache
+    if cached is not None and cached[0] == now_utc.year and cached[1] == now_utc.month:
+        return cached[2]
+
+    month_start_utc = now_utc.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    _month_start_cache = (now_utc.year, now_utc.month, month_start_utc)
+    return month_start_utc
+
+
+def invalidate_api_key_cache(raw_api_key: str | None = None) -> None:
+    """Drop one cached API key lookup, or all of them when no key is given."""
+    with _api_key_cache_lock:
+        if raw_api_key is None:
+            _api_key_cache.clear()
+        else:
+            _api_key_cache.pop(_hash_api_key(raw_api_key), None)
+
+
+async def require_api_key(api_key: str | None = Security(api_key_header)) -> AuthContext:
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Missing API key. Pass it in the X-API-Key header.",
         )
 
-    record = lookup_api_key(api_key)
+    record = await _lookup_api_key_cached(api_key)
     if record is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,19 +111,21 @@ def require_api_key(api_key: str | None = Security(api_key_header)) -> AuthConte
             detail="API key is inactive.",
         )
 
-    now_utc = datetime.now(timezone.utc)
-    month_start_utc = now_utc.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    used = count_successful_usage_for_month(
-        account_id=record.account_id, month_start_utc=month_start_utc
-    )
+    month_start_utc = _current_month_start_utc()
+    used = peek_monthly_success_count(account_id=record.account_id, month_start_utc=month_start_utc)
+    if used is None:
+        used = await asyncio.to_thread(
+            get_monthly_success_count,
+            account_id=record.account_id,
+            month_start_utc=month_start_utc,
+        )
     return AuthContext(
         record=record, successful_requests_this_month=used, month_start_utc=month_start_utc
     )
 
 
 def require_admin_token(admin_token: str | None = Security(admin_token_header)) -> str:
-    expected = os.getenv("PDF_API_ADMIN_TOKEN", "dev-admin-token")
-    if not admin_token or admin_token != expected:
+    if not admin_token or not hmac.compare_digest(admin_token.encode("utf-8"), _admin_token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid admin token.",
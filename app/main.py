@@ -1,20 +1,27 @@
-from pathlib import Path
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from app.api.routes import router
-from app.services.billing_store import init_db
+from app.api.routes import UploadSizeLimitMiddleware, pdf_service, router
+from app.paths import TEMPLATE_DIR
+from app.services.billing_store import init_db, start_usage_writer, stop_usage_writer
 
-templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent / "templates"))
+templates = Jinja2Templates(directory=str(TEMPLATE_DIR))
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     init_db()
+    start_usage_writer()
+    pdf_service.warm_templates()
+    if os.getenv("PDF_API_PREWARM_BROWSER", "1") == "1":
+        await pdf_service.startup()
     yield
+    await pdf_service.shutdown()
+    await stop_usage_writer()
 
 
 app = FastAPI(
@@ -34,6 +41,7 @@ app = FastAPI(
     license_info={"name": "MIT"},
     lifespan=lifespan,
 )
+app.add_middleware(UploadSizeLimitMiddleware)
 app.include_router(router)
 
 
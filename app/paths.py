@@ -0,0 +1,6 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+TEMPLATE_DIR = APP_DIR / "templates"
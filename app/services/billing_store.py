@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
 import hashlib
+import logging
 import os
 import secrets
 import sqlite3
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
@@ -14,6 +19,36 @@ DEFAULT_PLAN_QUOTAS: dict[str, int] = {
     "business": 20000,
 }
 
+USAGE_QUEUE_MAXSIZE = 1024
+USAGE_BATCH_SIZE = 128
+USAGE_FLUSH_INTERVAL_SECONDS = 0.1
+USAGE_QUEUE_SATURATION = 0.3
+USAGE_WRITE_ATTEMPTS = 3
+USAGE_WRITE_RETRY_SECONDS = 0.5
+
+# INSERT ... RETURNING needs SQLite 3.35+; older builds fall back to cursor.lastrowid.
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+UsageRow = tuple[int, int, str, int, int, int, str]
+
+logger = logging.getLogger(__name__)
+
+# Per-process cache of successful requests this month, keyed by account id. Seeded from
+# SQLite on first use each month and bumped as events are recorded, so quota checks stay O(1).
+# The lock only guards the dict; no SQLite call runs while it is held.
+_monthly_success_counts: dict[int, tuple[datetime, int]] = {}
+_monthly_success_counts_lock = threading.Lock()
+_tls = threading.local()
+
+_usage_loop: asyncio.AbstractEventLoop | None = None
+_usage_queue: asyncio.Queue[UsageRow] | None = None
+_usage_writer_task: asyncio.Task[None] | None = None
+# Rows queued and rows handled by the writer since it started. The queue is FIFO, so
+# flush_usage_events can wait for a watermark instead of for the queue to drain.
+_usage_enqueued = 0
+_usage_written = 0
+_usage_progress: asyncio.Condition | None = None
+
 
 @dataclass(frozen=True)
 class APIKeyRecord:
@@ -28,16 +63,35 @@ class APIKeyRecord:
 
 
 def _db_path() -> Path:
-    raw_path = os.getenv("PDF_API_DB_PATH", "output/pdf_api.sqlite3")
+    return _prepare_db_path(os.getenv("PDF_API_DB_PATH", "output/pdf_api.sqlite3"))
+
+
+@functools.lru_cache(maxsize=1)
+def _prepare_db_path(raw_path: str) -> Path:
     path = Path(raw_path)
     path.parent.mkdir(parents=True, exist_ok=True)
     return path
 
 
 def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(_db_path()))
+    """Return this thread's autocommit connection, opening it on first use."""
+    path = str(_db_path())
+    conn: sqlite3.Connection | None = getattr(_tls, "conn", None)
+    if conn is not None and _tls.path == path:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    conn = sqlite3.connect(path, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA wal_autocheckpoint = 1000")
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -20000")
+    _tls.conn = conn
+    _tls.path = path
     return conn
 
 
@@ -45,64 +99,95 @@ def _utcnow_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _hash_api_key(raw_api_key: str) -> str:
+@functools.lru_cache(maxsize=64)
+def _month_bounds_iso(year: int, month: int) -> tuple[str, str]:
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start.isoformat(), end.isoformat()
+
+
+def _hash_api_key_uncached(raw_api_key: str) -> str:
     salt = os.getenv("PDF_API_KEY_SALT", "change-me-in-production")
     return hashlib.sha256(f"{salt}:{raw_api_key}".encode("utf-8")).hexdigest()
 
 
+# Memoising is only correct while the salt stays fixed for the life of the process, so it is
+# opt-in for deployments that never rotate PDF_API_KEY_SALT at runtime.
+_hash_api_key = (
+    functools.lru_cache(maxsize=4096)(_hash_api_key_uncached)
+    if os.getenv("PDF_API_KEY_HASH_CACHE") == "1"
+    else _hash_api_key_uncached
+)
+
+
 def init_db() -> None:
-    with _connect() as conn:
-        conn.executescript(
-            """
-            CREATE TABLE IF NOT EXISTS accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                plan TEXT NOT NULL,
-                monthly_quota INTEGER NOT NULL CHECK (monthly_quota >= 0),
-                is_active INTEGER NOT NULL DEFAULT 1,
-                created_at TEXT NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS api_keys (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
-                key_prefix TEXT NOT NULL,
-                key_hash TEXT NOT NULL UNIQUE,
-                is_active INTEGER NOT NULL DEFAULT 1,
-                created_at TEXT NOT NULL,
-                revoked_at TEXT
-            );
-
-            CREATE TABLE IF NOT EXISTS usage_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                api_key_id INTEGER NOT NULL REFERENCES api_keys(id) ON DELETE CASCADE,
-                account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
-                request_mode TEXT NOT NULL,
-                success INTEGER NOT NULL,
-                status_code INTEGER NOT NULL,
-                pdf_bytes INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_usage_events_account_created
-                ON usage_events(account_id, created_at);
-            CREATE INDEX IF NOT EXISTS idx_usage_events_api_key_created
-                ON usage_events(api_key_id, created_at);
-            """
-        )
+    conn = _connect()
+    # WAL is persisted in the database file; the other PRAGMAs are per-connection (_connect).
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            monthly_quota INTEGER NOT NULL CHECK (monthly_quota >= 0),
+            is_active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
+            key_prefix TEXT NOT NULL,
+            key_hash TEXT NOT NULL UNIQUE,
+            is_active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            revoked_at TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS usage_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            api_key_id INTEGER NOT NULL REFERENCES api_keys(id) ON DELETE CASCADE,
+            account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
+            request_mode TEXT NOT NULL,
+            success INTEGER NOT NULL,
+            status_code INTEGER NOT NULL,
+            pdf_bytes INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_usage_events_account_created
+            ON usage_events(account_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_usage_events_account_success_created
+            ON usage_events(account_id, success, created_at);
+        CREATE INDEX IF NOT EXISTS idx_usage_events_api_key_created
+            ON usage_events(api_key_id, created_at);
+        """
+    )
 
 
-def _create_account(*, name: str, plan: str, monthly_quota: int) -> int:
-    with _connect() as conn:
+def _create_account(conn: sqlite3.Connection, *, name: str, plan: str, monthly_quota: int) -> int:
+    params = (name, plan, monthly_quota, _utcnow_iso())
+    if not _SQLITE_HAS_RETURNING:
         cur = conn.execute(
             """
             INSERT INTO accounts(name, plan, monthly_quota, is_active, created_at)
             VALUES (?, ?, ?, 1, ?)
             """,
-            (name, plan, monthly_quota, _utcnow_iso()),
+            params,
         )
         return int(cur.lastrowid)
 
+    row = conn.execute(
+        """
+        INSERT INTO accounts(name, plan, monthly_quota, is_active, created_at)
+        VALUES (?, ?, ?, 1, ?)
+        RETURNING id
+        """,
+        params,
+    ).fetchone()
+    return int(row["id"])
+
 
 def create_api_key_for_account(
     *,
@@ -119,14 +204,16 @@ def create_api_key_for_account(
     if quota < 0:
         raise ValueError("monthly_quota must be >= 0.")
 
-    account_id = _create_account(
-        name=account_name.strip(), plan=normalized_plan, monthly_quota=quota
-    )
     generated_api_key = raw_api_key or secrets.token_urlsafe(32)
     key_hash = _hash_api_key(generated_api_key)
     key_prefix = generated_api_key[:10]
 
-    with _connect() as conn:
+    conn = _connect()
+    conn.execute("BEGIN")
+    try:
+        account_id = _create_account(
+            conn, name=account_name.strip(), plan=normalized_plan, monthly_quota=quota
+        )
         conn.execute(
             """
             INSERT INTO api_keys(account_id, key_prefix, key_hash, is_active, created_at, revoked_at)
@@ -134,30 +221,34 @@ def create_api_key_for_account(
             """,
             (account_id, key_prefix, key_hash, _utcnow_iso()),
         )
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
     return generated_api_key
 
 
 def lookup_api_key(raw_api_key: str) -> APIKeyRecord | None:
     key_hash = _hash_api_key(raw_api_key)
-    with _connect() as conn:
-        row = conn.execute(
-            """
-            SELECT
-                k.id AS api_key_id,
-                a.id AS account_id,
-                a.name AS account_name,
-                a.plan AS plan,
-                a.monthly_quota AS monthly_quota,
-                a.is_active AS account_active,
-                k.is_active AS api_key_active,
-                k.key_prefix AS key_prefix
-            FROM api_keys k
-            JOIN accounts a ON a.id = k.account_id
-            WHERE k.key_hash = ?
-            """,
-            (key_hash,),
-        ).fetchone()
+    conn = _connect()
+    row = conn.execute(
+        """
+        SELECT
+            k.id AS api_key_id,
+            a.id AS account_id,
+            a.name AS account_name,
+            a.plan AS plan,
+            a.monthly_quota AS monthly_quota,
+            a.is_active AS account_active,
+            k.is_active AS api_key_active,
+            k.key_prefix AS key_prefix
+        FROM api_keys k
+        JOIN accounts a ON a.id = k.account_id
+        WHERE k.key_hash = ?
+        """,
+        (key_hash,),
+    ).fetchone()
 
     if row is None:
         return None
@@ -177,29 +268,97 @@ def lookup_api_key(raw_api_key: str) -> APIKeyRecord | None:
 def count_successful_usage_for_month(*, account_id: int, month_start_utc: datetime) -> int:
     if month_start_utc.tzinfo is None:
         raise ValueError("month_start_utc must be timezone-aware.")
-    if month_start_utc.month == 12:
-        month_end_utc = month_start_utc.replace(year=month_start_utc.year + 1, month=1, day=1)
-    else:
-        month_end_utc = month_start_utc.replace(month=month_start_utc.month + 1, day=1)
+    month_start_iso, month_end_iso = _month_bounds_iso(month_start_utc.year, month_start_utc.month)
+
+    conn = _connect()
+    row = conn.execute(
+        """
+        SELECT COUNT(*) AS cnt
+        FROM usage_events
+        WHERE account_id = ?
+          AND success = 1
+          AND created_at >= ?
+          AND created_at < ?
+        """,
+        (
+            account_id,
+            month_start_iso,
+            month_end_iso,
+        ),
+    ).fetchone()
 
-    with _connect() as conn:
-        row = conn.execute(
+    return int(row["cnt"]) if row else 0
+
+
+def peek_monthly_success_count(*, account_id: int, month_start_utc: datetime) -> int | None:
+    """Return the cached count for the month, or None if it has not been seeded yet."""
+    with _monthly_success_counts_lock:
+        cached = _monthly_success_counts.get(account_id)
+    if cached is not None and cached[0] == month_start_utc:
+        return cached[1]
+    return None
+
+
+def get_monthly_success_count(*, account_id: int, month_start_utc: datetime) -> int:
+    cached = peek_monthly_success_count(account_id=account_id, month_start_utc=month_start_utc)
+    if cached is not None:
+        return cached
+    # Count outside the lock so SQLite never runs while the event loop may want it.
+    count = count_successful_usage_for_month(account_id=account_id, month_start_utc=month_start_utc)
+    with _monthly_success_counts_lock:
+        cached_entry = _monthly_success_counts.get(account_id)
+        if cached_entry is not None and cached_entry[0] == month_start_utc:
+            return cached_entry[1]
+        _monthly_success_counts[account_id] = (month_start_utc, count)
+    return count
+
+
+def _insert_usage_rows(rows: list[UsageRow]) -> None:
+    conn = _connect()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
             """
-            SELECT COUNT(*) AS cnt
-            FROM usage_events
-            WHERE account_id = ?
-              AND success = 1
-              AND created_at >= ?
-              AND created_at < ?
+            INSERT INTO usage_events(
+                api_key_id, account_id, request_mode, success, status_code, pdf_bytes, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
-            (
-                account_id,
-                month_start_utc.isoformat(),
-                month_end_utc.isoformat(),
-            ),
-        ).fetchone()
+            rows,
+        )
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
-    return int(row["cnt"]) if row else 0
+
+def _usage_row(
+    *,
+    api_key_id: int,
+    account_id: int,
+    request_mode: str,
+    success: bool,
+    status_code: int,
+    pdf_bytes: int,
+    created_at: datetime,
+) -> UsageRow:
+    return (
+        api_key_id,
+        account_id,
+        request_mode,
+        1 if success else 0,
+        status_code,
+        max(0, pdf_bytes),
+        created_at.isoformat(),
+    )
+
+
+def _bump_monthly_success_count(account_id: int, created_at: datetime) -> None:
+    month_start_utc = created_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    with _monthly_success_counts_lock:
+        cached = _monthly_success_counts.get(account_id)
+        if cached is not None and cached[0] == month_start_utc:
+            _monthly_success_counts[account_id] = (month_start_utc, cached[1] + 1)
 
 
 def log_usage_event(
@@ -211,53 +370,184 @@ def log_usage_event(
     status_code: int,
     pdf_bytes: int,
 ) -> None:
-    with _connect() as conn:
-        conn.execute(
-            """
-            INSERT INTO usage_events(
-                api_key_id, account_id, request_mode, success, status_code, pdf_bytes, created_at
+    """Record a usage event with a synchronous insert (for threads and scripts)."""
+    created_at = datetime.now(timezone.utc)
+    _insert_usage_rows(
+        [
+            _usage_row(
+                api_key_id=api_key_id,
+                account_id=account_id,
+                request_mode=request_mode,
+                success=success,
+                status_code=status_code,
+                pdf_bytes=pdf_bytes,
+                created_at=created_at,
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                api_key_id,
-                account_id,
-                request_mode,
-                1 if success else 0,
-                status_code,
-                max(0, pdf_bytes),
-                _utcnow_iso(),
-            ),
-        )
+        ]
+    )
+    if success:
+        _bump_monthly_success_count(account_id, created_at)
+
+
+async def record_usage_event(
+    *,
+    api_key_id: int,
+    account_id: int,
+    request_mode: str,
+    success: bool,
+    status_code: int,
+    pdf_bytes: int,
+) -> None:
+    """Record a usage event without running SQLite on the event loop.
+
+    On the loop that owns the background writer the row is queued (waiting for room when
+    the queue is full); anywhere else it is inserted from a worker thread.
+    """
+    created_at = datetime.now(timezone.utc)
+    row = _usage_row(
+        api_key_id=api_key_id,
+        account_id=account_id,
+        request_mode=request_mode,
+        success=success,
+        status_code=status_code,
+        pdf_bytes=pdf_bytes,
+        created_at=created_at,
+    )
+    global _usage_enqueued
+    queue = _usage_queue
+    if queue is not None and _running_loop() is _usage_loop:
+        await queue.put(row)
+        _usage_enqueued += 1
+    else:
+        await asyncio.to_thread(_insert_usage_rows, [row])
+    if success:
+        _bump_monthly_success_count(account_id, created_at)
+
+
+def _running_loop() -> asyncio.AbstractEventLoop | None:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+async def _write_usage_batch(batch: list[UsageRow]) -> None:
+    """Insert a batch, retrying transient failures and falling back to row-by-row inserts."""
+    for attempt in range(1, USAGE_WRITE_ATTEMPTS + 1):
+        try:
+            await asyncio.to_thread(_insert_usage_rows, batch)
+            return
+        except sqlite3.IntegrityError:
+            break  # A bad row; retrying the whole batch cannot succeed.
+        except Exception:  # noqa: BLE001 - logged below or on the final fallback
+            if attempt == USAGE_WRITE_ATTEMPTS:
+                break
+            logger.warning(
+                "Writing %d usage events failed (attempt %d); retrying.", len(batch), attempt
+            )
+            await asyncio.sleep(USAGE_WRITE_RETRY_SECONDS * attempt)
+
+    # Last resort: row by row, so only the rows that really cannot be stored are dropped.
+    dropped = 0
+    for row in batch:
+        try:
+            await asyncio.to_thread(_insert_usage_rows, [row])
+        except Exception:
+            dropped += 1
+            logger.exception("Dropping usage event %r.", row)
+    if dropped:
+        logger.error("Dropped %d of %d usage events.", dropped, len(batch))
+
+
+async def _usage_writer(queue: asyncio.Queue[UsageRow], progress: asyncio.Condition) -> None:
+    global _usage_written
+    while True:
+        batch = [await queue.get()]
+        try:
+            # Give a batch time to accumulate unless the queue is already filling up.
+            if queue.qsize() < USAGE_QUEUE_MAXSIZE * USAGE_QUEUE_SATURATION:
+                await asyncio.sleep(USAGE_FLUSH_INTERVAL_SECONDS)
+            while len(batch) < USAGE_BATCH_SIZE:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            await _write_usage_batch(batch)
+        except Exception:
+            # Keep the writer alive: flush_usage_events/stop_usage_writer wait on this queue.
+            logger.exception("Usage writer failed on a batch of %d events.", len(batch))
+        finally:
+            for _ in batch:
+                queue.task_done()
+            _usage_written += len(batch)
+            async with progress:
+                progress.notify_all()
+
+
+def start_usage_writer() -> None:
+    """Start batching usage events on the running event loop."""
+    global _usage_loop, _usage_queue, _usage_writer_task
+    global _usage_enqueued, _usage_written, _usage_progress
+    if _usage_writer_task is not None:
+        return
+    _usage_loop = asyncio.get_running_loop()
+    _usage_queue = asyncio.Queue(maxsize=USAGE_QUEUE_MAXSIZE)
+    _usage_enqueued, _usage_written = 0, 0
+    _usage_progress = asyncio.Condition()
+    _usage_writer_task = asyncio.create_task(_usage_writer(_usage_queue, _usage_progress))
+
+
+async def flush_usage_events() -> None:
+    """Wait until every usage event queued before this call has been written.
+
+    Events queued while waiting are left to the writer, so steady traffic cannot keep a
+    caller (e.g. the usage summary endpoint) waiting indefinitely.
+    """
+    progress = _usage_progress
+    if progress is None or _running_loop() is not _usage_loop:
+        return
+    watermark = _usage_enqueued
+    async with progress:
+        await progress.wait_for(lambda: _usage_written >= watermark)
+
+
+async def stop_usage_writer() -> None:
+    global _usage_loop, _usage_queue, _usage_writer_task, _usage_progress
+    queue, task = _usage_queue, _usage_writer_task
+    if queue is None or task is None:
+        return
+
+    _usage_loop, _usage_queue, _usage_writer_task, _usage_progress = None, None, None, None
+    await queue.join()
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
 
 
 def get_usage_summary_for_month(*, account_id: int, month_start_utc: datetime) -> dict[str, int]:
     if month_start_utc.tzinfo is None:
         raise ValueError("month_start_utc must be timezone-aware.")
-    if month_start_utc.month == 12:
-        month_end_utc = month_start_utc.replace(year=month_start_utc.year + 1, month=1, day=1)
-    else:
-        month_end_utc = month_start_utc.replace(month=month_start_utc.month + 1, day=1)
-
-    with _connect() as conn:
-        row = conn.execute(
-            """
-            SELECT
-                COUNT(*) AS total_requests,
-                SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) AS successful_requests,
-                SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) AS failed_requests,
-                COALESCE(SUM(pdf_bytes), 0) AS total_pdf_bytes
-            FROM usage_events
-            WHERE account_id = ?
-              AND created_at >= ?
-              AND created_at < ?
-            """,
-            (
-                account_id,
-                month_start_utc.isoformat(),
-                month_end_utc.isoformat(),
-            ),
-        ).fetchone()
+    month_start_iso, month_end_iso = _month_bounds_iso(month_start_utc.year, month_start_utc.month)
+
+    conn = _connect()
+    row = conn.execute(
+        """
+        SELECT
+            COUNT(*) AS total_requests,
+            SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) AS successful_requests,
+            SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) AS failed_requests,
+            COALESCE(SUM(pdf_bytes), 0) AS total_pdf_bytes
+        FROM usage_events
+        WHERE account_id = ?
+          AND created_at >= ?
+          AND created_at < ?
+        """,
+        (
+            account_id,
+            month_start_iso,
+            month_end_iso,
+        ),
+    ).fetchone()
 
     if row is None:
         return {
@@ -280,27 +570,43 @@ def update_monthly_quota_for_api_key(*, raw_api_key: str, monthly_quota: int) ->
         raise ValueError("monthly_quota must be >= 0.")
 
     key_hash = _hash_api_key(raw_api_key)
-    with _connect() as conn:
-        conn.execute(
-            """
-            UPDATE accounts
-            SET monthly_quota = ?
-            WHERE id IN (
-                SELECT account_id
-                FROM api_keys
-                WHERE key_hash = ?
-            )
-            """,
-            (monthly_quota, key_hash),
+    conn = _connect()
+    conn.execute(
+        """
+        UPDATE accounts
+        SET monthly_quota = ?
+        WHERE id IN (
+            SELECT account_id
+            FROM api_keys
+            WHERE key_hash = ?
         )
+        """,
+        (monthly_quota, key_hash),
+    )
+
+
+def revoke_api_key(raw_api_key: str) -> bool:
+    key_hash = _hash_api_key(raw_api_key)
+    conn = _connect()
+    cur = conn.execute(
+        """
+        UPDATE api_keys
+        SET is_active = 0, revoked_at = ?
+        WHERE key_hash = ? AND is_active = 1
+        """,
+        (_utcnow_iso(), key_hash),
+    )
+    return cur.rowcount > 0
 
 
 def reset_all_data() -> None:
-    with _connect() as conn:
-        conn.executescript(
-            """
-            DELETE FROM usage_events;
-            DELETE FROM api_keys;
-            DELETE FROM accounts;
-            """
-        )
+    with _monthly_success_counts_lock:
+        _monthly_success_counts.clear()
+    conn = _connect()
+    conn.executescript(
+        """
+        DELETE FROM usage_events;
+        DELETE FROM api_keys;
+        DELETE FROM accounts;
+        """
+    )
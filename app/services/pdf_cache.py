@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class PDFCache:
+    """Content-addressed store of generated PDFs on disk with LRU eviction."""
+
+    def __init__(self, directory: Path | None, *, max_entries: int = 512) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        self._index: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+            for path in sorted(directory.glob("*.pdf"), key=lambda item: item.stat().st_mtime):
+                self._index[path.stem] = None
+
+    @classmethod
+    def from_env(cls) -> PDFCache:
+        # Opt-in: cached PDFs are customer documents that outlive restarts.
+        raw_dir = os.getenv("PDF_API_PDF_CACHE_DIR", "")
+        max_entries = int(os.getenv("PDF_API_PDF_CACHE_MAX_ENTRIES", "512"))
+        return cls(Path(raw_dir) if raw_dir else None, max_entries=max_entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and self.max_entries > 0
+
+    def _path(self, digest: str) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{digest}.pdf"
+
+    def lookup(self, digest: str) -> tuple[Path, int] | None:
+        """Return the cached file and its size so callers can stream it instead of reading it."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if digest not in self._index:
+                return None
+            self._index.move_to_end(digest)
+        path = self._path(digest)
+        try:
+            return path, path.stat().st_size
+        except FileNotFoundError:
+            with self._lock:
+                self._index.pop(digest, None)
+            return None
+
+    def put(self, digest: str, pdf_bytes: bytes) -> None:
+        if not self.enabled:
+            return
+        path = self._path(digest)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(pdf_bytes)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._index[digest] = None
+            self._index.move_to_end(digest)
+            evicted = []
+            while len(self._index) > self.max_entries:
+                evicted.append(self._index.popitem(last=False)[0])
+        for old_digest in evicted:
+            self._path(old_digest).unlink(missing_ok=True)
+
+
+class MemoryPDFCache:
+    """Byte-budgeted in-process LRU of recent PDFs, checked before the disk cache.
+
+    Only touched from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, max_bytes: int, *, max_item_bytes: int = 5 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> MemoryPDFCache:
+        max_bytes = int(os.getenv("PDF_API_PDF_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+        max_item_bytes = int(
+            os.getenv("PDF_API_PDF_MEMORY_CACHE_MAX_ITEM_BYTES", str(5 * 1024 * 1024))
+        )
+        return cls(max_bytes, max_item_bytes=max_item_bytes)
+
+    def get(self, digest: str) -> bytes | None:
+        pdf_bytes = self._entries.get(digest)
+        if pdf_bytes is not None:
+            self._entries.move_to_end(digest)
+        return pdf_bytes
+
+    def put(self, digest: str, pdf_bytes: bytes) -> None:
+        if self.max_bytes <= 0 or len(pdf_bytes) > self.max_item_bytes:
+            return
+        previous = self._entries.pop(digest, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self._entries[digest] = pdf_bytes
+        self.total_bytes += len(pdf_bytes)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
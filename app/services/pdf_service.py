@@ -1,12 +1,89 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import contextlib
+import functools
+import os
 import re
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
 
-from jinja2 import Environment, FileSystemLoader, TemplateError, TemplateNotFound, select_autoescape
+from jinja2 import (
+    ChoiceLoader,
+    DictLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+    TemplateError,
+    TemplateNotFound,
+    select_autoescape,
+)
+from playwright.async_api import Browser, Page, Playwright, async_playwright
 from playwright.async_api import Error as PlaywrightError
-from playwright.async_api import async_playwright
+
+WaitUntil = Literal["load", "domcontentloaded", "networkidle"]
+RenderJob = tuple[str, WaitUntil, "asyncio.Future[bytes]"]
+
+CHROMIUM_LAUNCH_ARGS = (
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--no-zygote",
+    "--no-first-run",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--disable-features=Translate,BackForwardCache,MediaRouter",
+)
+
+# Files under the template directory that are Jinja templates; anything else (images, fonts)
+# is never preloaded or compiled.
+TEMPLATE_SUFFIXES = (".html", ".htm", ".j2", ".jinja", ".jinja2")
+
+# A4 in CSS pixels (96 dpi), so layout before printing matches the paper width.
+PAGE_VIEWPORT = {"width": 794, "height": 1123}
+PDF_OPTIONS: dict[str, Any] = {"format": "A4", "print_background": True}
+
+# HTML in this size band is loaded via a data: URL instead of set_content. The upper bound keeps
+# the base64 URL under Chromium's 2 MiB URL length limit.
+DATA_URL_MIN_BYTES = 256 * 1024
+DATA_URL_MAX_BYTES = 1536 * 1024 - 64
+
+# Anything that opens like a full document (doctype, comment, XML prolog, <html> or <head>) goes
+# through the tag search, even behind a byte order mark; everything else is a bare fragment and is
+# wrapped directly.
+_DOCUMENT_START_RE = re.compile(r"[\s\ufeff]*<(?:[!?]|html|head)", re.IGNORECASE)
+_HEAD_CLOSE_RE = re.compile(r"</head\s*>", re.IGNORECASE)
+_HTML_OPEN_RE = re.compile(r"<html[^>]*>", re.IGNORECASE)
+
+
+@functools.cache
+def _make_env(template_dir: Path) -> Environment:
+    """Build one Jinja environment per template directory, shared by every PDFService."""
+    bytecode_cache_dir = os.getenv("PDF_API_JINJA_BYTECODE_CACHE_DIR")
+    bytecode_cache = None
+    if bytecode_cache_dir:
+        Path(bytecode_cache_dir).mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+    # Templates shipped with the app are served from memory; the filesystem loader only sees
+    # names that were not there at startup.
+    preloaded = {
+        path.relative_to(template_dir).as_posix(): path.read_text(encoding="utf-8")
+        for path in sorted(template_dir.rglob("*"))
+        if path.suffix.lower() in TEMPLATE_SUFFIXES and path.is_file()
+    }
+    return Environment(
+        loader=ChoiceLoader([DictLoader(preloaded), FileSystemLoader(str(template_dir))]),
+        autoescape=select_autoescape(["html", "xml"]),
+        auto_reload=False,
+        cache_size=-1,
+        bytecode_cache=bytecode_cache,
+    )
 
 
 class TemplateRenderError(Exception):
@@ -18,11 +95,128 @@ class PDFGenerationError(Exception):
 
 
 class PDFService:
-    def __init__(self, template_dir: Path) -> None:
-        self.env = Environment(
-            loader=FileSystemLoader(str(template_dir)),
-            autoescape=select_autoescape(["html", "xml"]),
+    def __init__(
+        self,
+        template_dir: Path,
+        *,
+        max_concurrency: int = 4,
+    ) -> None:
+        self.env = _make_env(Path(template_dir))
+        # Bound to this instance's env; misses (TemplateNotFound) are not cached.
+        self._get_template = functools.lru_cache(maxsize=256)(self.env.get_template)
+        self.max_concurrency = max(1, max_concurrency)
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+        self._browser_lock = asyncio.Lock()
+        self._queue: asyncio.Queue[RenderJob] | None = None
+        self._workers: list[asyncio.Task[None]] = []
+
+    async def startup(self) -> None:
+        """Launch the shared Chromium instance and start the render workers."""
+        await self._get_browser()
+        self._ensure_workers()
+
+    def warm_templates(self) -> int:
+        """Compile every template under the template directory so first requests skip parsing."""
+        names = self.env.list_templates(
+            filter_func=lambda name: name.lower().endswith(TEMPLATE_SUFFIXES)
         )
+        for name in names:
+            self._get_template(name)
+        return len(names)
+
+    async def shutdown(self) -> None:
+        workers, self._workers = self._workers, []
+        queue, self._queue = self._queue, None
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        while queue is not None and not queue.empty():
+            *_, future = queue.get_nowait()
+            if not future.done():
+                future.set_exception(PDFGenerationError("PDF service is shutting down."))
+
+        async with self._browser_lock:
+            if self._browser is not None:
+                await self._browser.close()
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    async def _get_browser(self) -> Browser:
+        browser = self._browser
+        if browser is not None and browser.is_connected():
+            return browser
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True,
+                    chromium_sandbox=False,
+                    args=list(CHROMIUM_LAUNCH_ARGS),
+                )
+            return self._browser
+
+    def _ensure_workers(self) -> asyncio.Queue[RenderJob]:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [
+                asyncio.create_task(self._render_worker(self._queue))
+                for _ in range(self.max_concurrency)
+            ]
+        return self._queue
+
+    async def _open_page(self) -> Page:
+        browser = await self._get_browser()
+        context = await browser.new_context(viewport=PAGE_VIEWPORT)
+        try:
+            page = await context.new_page()
+
+            async def close_popup(popup: Page) -> None:
+                # Popups (window.open) add nothing to the PDF; don't let them run alongside it.
+                if popup is not page:
+                    with contextlib.suppress(PlaywrightError):
+                        await popup.close()
+
+            context.on("page", close_popup)
+            await page.emulate_media(media="print")
+            return page
+        except BaseException:
+            with contextlib.suppress(PlaywrightError):
+                await context.close()
+            raise
+
+    @staticmethod
+    async def _close_page(page: Page | None) -> None:
+        if page is not None:
+            with contextlib.suppress(PlaywrightError):
+                await page.context.close()
+
+    async def _render_worker(self, queue: asyncio.Queue[RenderJob]) -> None:
+        """Serve queued renders one at a time, each in a fresh browser context.
+
+        Only the browser is kept warm: a context per job means no cookies, storage, service
+        workers or HTTP cache carry over from one account's render to the next.
+        """
+        while True:
+            html, wait_until, future = await queue.get()
+            page: Page | None = None
+            try:
+                if future.done():
+                    continue
+                page = await self._open_page()
+                await self._load_html(page, html, wait_until)
+                pdf_bytes = await page.pdf(**PDF_OPTIONS)
+                if not future.done():
+                    future.set_result(pdf_bytes)
+            except Exception as exc:  # noqa: BLE001 - handed to the waiting caller
+                if not future.done():
+                    future.set_exception(exc)
+            finally:
+                await self._close_page(page)
+                queue.task_done()
 
     def build_html(
         self,
@@ -37,44 +231,69 @@ class PDFService:
         if not template_name:
             raise TemplateRenderError("Missing render source.")
         try:
-            template = self.env.get_template(template_name)
+            template = self._get_template(template_name)
         except TemplateNotFound as exc:
             raise TemplateRenderError(f"Template '{template_name}' was not found.") from exc
         return template.render(**(data or {}), css=css)
 
+    def compile_template(self, template_content: str) -> Template:
+        try:
+            return self.env.from_string(template_content)
+        except TemplateError as exc:
+            raise TemplateRenderError("Uploaded template could not be rendered.") from exc
+
     def render_template_content(
-        self, *, template_content: str, css: str | None, data: dict[str, Any] | None
+        self,
+        *,
+        css: str | None,
+        data: dict[str, Any] | None,
+        template_content: str | None = None,
+        compiled_template: Template | None = None,
     ) -> str:
+        if compiled_template is None:
+            if template_content is None:
+                raise TemplateRenderError("Missing render source.")
+            compiled_template = self.compile_template(template_content)
         try:
-            template = self.env.from_string(template_content)
-            return template.render(**(data or {}), css=css)
+            return compiled_template.render(**(data or {}), css=css)
         except TemplateError as exc:
             raise TemplateRenderError("Uploaded template could not be rendered.") from exc
 
-    async def generate_pdf(self, html: str) -> bytes:
+    async def generate_pdf(self, html: str, wait_until: WaitUntil = "load") -> bytes:
+        queue = self._ensure_workers()
+        future: asyncio.Future[bytes] = asyncio.get_running_loop().create_future()
+        await queue.put((html, wait_until, future))
         try:
-            async with async_playwright() as playwright:
-                browser = await playwright.chromium.launch(
-                    args=["--disable-dev-shm-usage", "--no-sandbox"]
-                )
-                page = await browser.new_page()
-                await page.set_content(html, wait_until="networkidle")
-                pdf_bytes = await page.pdf(format="A4", print_background=True)
-                await browser.close()
-                return pdf_bytes
+            return await future
         except PlaywrightError as exc:
             raise PDFGenerationError("Failed to generate PDF with Playwright.") from exc
 
+    @staticmethod
+    async def _load_html(page: Page, html: str, wait_until: WaitUntil) -> None:
+        # A UTF-8 character is 1-4 bytes, so most inputs are ruled out without encoding them.
+        if len(html) * 4 >= DATA_URL_MIN_BYTES and len(html) <= DATA_URL_MAX_BYTES:
+            encoded = html.encode("utf-8")
+            if DATA_URL_MIN_BYTES <= len(encoded) <= DATA_URL_MAX_BYTES:
+                payload = base64.b64encode(encoded).decode("ascii")
+                await page.goto(
+                    f"data:text/html;charset=utf-8;base64,{payload}", wait_until=wait_until
+                )
+                return
+        await page.set_content(html, wait_until=wait_until)
+
     @staticmethod
     def _inject_css(*, html: str, css: str | None) -> str:
         if not css:
             return html
         style_tag = f"<style>{css}</style>"
-        head_close_index = html.lower().find("</head>")
-        if head_close_index != -1:
-            return f"{html[:head_close_index]}{style_tag}{html[head_close_index:]}"
-        html_match = re.search(r"<html[^>]*>", html, flags=re.IGNORECASE)
+        if not _DOCUMENT_START_RE.match(html):
+            return f"<html><head>{style_tag}</head><body>{html}</body></html>"
+        head_close_match = _HEAD_CLOSE_RE.search(html)
+        if head_close_match:
+            head_close_index = head_close_match.start()
+            return "".join((html[:head_close_index], style_tag, html[head_close_index:]))
+        html_match = _HTML_OPEN_RE.search(html)
         if html_match:
             insert_at = html_match.end()
-            return f"{html[:insert_at]}<head>{style_tag}</head>{html[insert_at:]}"
+            return "".join((html[:insert_at], "<head>", style_tag, "</head>", html[insert_at:]))
         return f"<html><head>{style_tag}</head><body>{html}</body></html>"
@@ -2,10 +2,12 @@ from __future__ import annotations
 
 import os
 import sys
+from collections.abc import Iterator
 from importlib import import_module
 from pathlib import Path
 
 import pytest
+from fastapi.testclient import TestClient
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
@@ -13,17 +15,38 @@ if str(ROOT) not in sys.path:
 
 billing_store = import_module("app.services.billing_store")
 create_api_key_for_account = billing_store.create_api_key_for_account
+flush_usage_events = billing_store.flush_usage_events
+# Tests flush after nearly every request; don't wait out the production batching window.
+billing_store.USAGE_FLUSH_INTERVAL_SECONDS = 0
 init_db = billing_store.init_db
 reset_all_data = billing_store.reset_all_data
 
 os.environ["PDF_API_DB_PATH"] = str(ROOT / "output" / "test_api.sqlite3")
 os.environ["PDF_API_ADMIN_TOKEN"] = "test-admin-token"
+os.environ["PDF_API_PDF_CACHE_DIR"] = ""
+os.environ["PDF_API_PDF_MEMORY_CACHE_BYTES"] = "0"
+os.environ["PDF_API_PREWARM_BROWSER"] = "0"
 
-init_db()
+invalidate_api_key_cache = import_module("app.api.security").invalidate_api_key_cache
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _database() -> None:
+    init_db()
+
+
+@pytest.fixture(scope="session")
+def client() -> Iterator[TestClient]:
+    # One app lifespan for the whole run: the usage writer and PDF service start once.
+    with TestClient(import_module("app.main").app) as test_client:
+        yield test_client
 
 
 @pytest.fixture
-def api_key() -> str:
+def api_key(client: TestClient) -> str:
+    # Land usage events queued by the previous test before their rows are deleted; the
+    # schema is created once per session, and reset_all_data only deletes rows.
+    client.portal.call(flush_usage_events)
     reset_all_data()
-    init_db()
+    invalidate_api_key_cache()
     return create_api_key_for_account(account_name="Test Account", plan="pro", monthly_quota=50)
@@ -1,17 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+import sqlite3
+import threading
 from datetime import datetime, timezone
 
+import pytest
 from fastapi.testclient import TestClient
 
-from app.api import routes
-from app.main import app
-from app.services.billing_store import update_monthly_quota_for_api_key
+from app.api import routes, security
+from app.services import billing_store
+from app.services.billing_store import create_api_key_for_account, update_monthly_quota_for_api_key
 
-client = TestClient(app)
 
-
-def test_generate_requires_api_key() -> None:
+def test_generate_requires_api_key(client: TestClient) -> None:
     response = client.post(
         "/generate",
         files=[("html_file", ("input.html", "<h1>Hello</h1>", "text/html"))],
@@ -20,7 +22,7 @@ def test_generate_requires_api_key() -> None:
     assert "missing api key" in response.json()["detail"].lower()
 
 
-def test_generate_rejects_invalid_api_key() -> None:
+def test_generate_rejects_invalid_api_key(client: TestClient) -> None:
     response = client.post(
         "/generate",
         files=[("html_file", ("input.html", "<h1>Hello</h1>", "text/html"))],
@@ -28,10 +30,11 @@ def test_generate_rejects_invalid_api_key() -> None:
     )
     assert response.status_code == 401
     assert "invalid api key" in response.json()["detail"].lower()
+    assert security._hash_api_key("invalid-key") not in security._api_key_cache
 
 
-def test_generate_rejects_quota_exceeded(monkeypatch, api_key: str) -> None:
-    async def fake_generate_pdf(html: str) -> bytes:
+def test_generate_rejects_quota_exceeded(client: TestClient, monkeypatch, api_key: str) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
         return b"%PDF-1.7\nfake"
 
     monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
@@ -46,7 +49,7 @@ def test_generate_rejects_quota_exceeded(monkeypatch, api_key: str) -> None:
     assert "quota exceeded" in response.json()["detail"].lower()
 
 
-def test_admin_can_create_api_key(api_key: str) -> None:
+def test_admin_can_create_api_key(client: TestClient, api_key: str) -> None:
     response = client.post(
         "/admin/api-keys",
         headers={"X-Admin-Token": "test-admin-token"},
@@ -61,8 +64,8 @@ def test_admin_can_create_api_key(api_key: str) -> None:
     assert len(body["api_key"]) >= 20
 
 
-def test_admin_usage_summary(monkeypatch, api_key: str) -> None:
-    async def fake_generate_pdf(html: str) -> bytes:
+def test_admin_usage_summary(client: TestClient, monkeypatch, api_key: str) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
         return b"%PDF-1.7\nfake-usage"
 
     monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
@@ -86,3 +89,226 @@ def test_admin_usage_summary(monkeypatch, api_key: str) -> None:
     assert body["successful_requests"] == 1
     assert body["total_requests"] >= 1
     assert body["total_pdf_bytes"] > 0
+
+
+def test_admin_can_revoke_api_key(client: TestClient, monkeypatch, api_key: str) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+
+    first_response = client.post(
+        "/generate",
+        files=[("html_file", ("input.html", "<h1>Hello</h1>", "text/html"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert first_response.status_code == 200
+
+    revoke_response = client.post(
+        "/admin/api-keys/revoke",
+        headers={"X-Admin-Token": "test-admin-token"},
+        json={"api_key": api_key},
+    )
+    assert revoke_response.status_code == 200
+    assert revoke_response.json() == {"key_prefix": api_key[:10], "revoked": True}
+
+    second_response = client.post(
+        "/generate",
+        files=[("html_file", ("input.html", "<h1>Hello</h1>", "text/html"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert second_response.status_code == 403
+    assert "inactive" in second_response.json()["detail"].lower()
+
+
+def test_generate_counts_successful_requests_against_quota(
+    client: TestClient, monkeypatch, api_key: str
+) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+    update_monthly_quota_for_api_key(raw_api_key=api_key, monthly_quota=1)
+
+    responses = [
+        client.post(
+            "/generate",
+            files=[("html_file", ("input.html", "<h1>Hello</h1>", "text/html"))],
+            headers={"X-API-Key": api_key},
+        )
+        for _ in range(2)
+    ]
+    assert [response.status_code for response in responses] == [200, 429]
+
+
+def test_usage_summary_includes_queued_events(
+    client: TestClient, monkeypatch, api_key: str
+) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        return b"%PDF-1.7\nfake-queued"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+
+    for _ in range(3):
+        response = client.post(
+            "/generate",
+            files=[("html_file", ("input.html", "<h1>Hello</h1>", "text/html"))],
+            headers={"X-API-Key": api_key},
+        )
+        assert response.status_code == 200
+
+    usage_response = client.get(
+        "/admin/usage",
+        headers={"X-Admin-Token": "test-admin-token"},
+        params={"api_key": api_key},
+    )
+    assert usage_response.status_code == 200
+    assert usage_response.json()["successful_requests"] == 3
+
+
+def test_duplicate_api_key_does_not_leave_orphan_account(api_key: str) -> None:
+    with pytest.raises(sqlite3.IntegrityError):
+        create_api_key_for_account(account_name="Duplicate", plan="free", raw_api_key=api_key)
+
+    row = billing_store._connect().execute("SELECT COUNT(*) AS cnt FROM accounts").fetchone()
+    assert row["cnt"] == 1
+
+
+def test_admin_endpoints_reject_wrong_token(client: TestClient) -> None:
+    response = client.post(
+        "/admin/api-keys",
+        headers={"X-Admin-Token": "test-admin-tokem"},
+        json={"account_name": "Acme Billing", "plan": "free"},
+    )
+    assert response.status_code == 401
+    assert "invalid admin token" in response.json()["detail"].lower()
+
+
+def test_usage_recording_keeps_sqlite_off_the_loop_and_the_counter_lock(
+    monkeypatch, api_key: str
+) -> None:
+    insert_threads: list[int] = []
+    real_insert = billing_store._insert_usage_rows
+    real_count = billing_store.count_successful_usage_for_month
+
+    def insert(rows):
+        insert_threads.append(threading.get_ident())
+        real_insert(rows)
+
+    def count(**kwargs):
+        assert not billing_store._monthly_success_counts_lock.locked()
+        return real_count(**kwargs)
+
+    monkeypatch.setattr(billing_store, "_insert_usage_rows", insert)
+    monkeypatch.setattr(billing_store, "count_successful_usage_for_month", count)
+    record = billing_store.lookup_api_key(api_key)
+    month_start = datetime.now(timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+    async def run() -> int:
+        await billing_store.record_usage_event(
+            api_key_id=record.api_key_id,
+            account_id=record.account_id,
+            request_mode="html_file",
+            success=True,
+            status_code=200,
+            pdf_bytes=10,
+        )
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+
+    assert insert_threads and loop_thread not in insert_threads
+    count_now = billing_store.get_monthly_success_count(
+        account_id=record.account_id, month_start_utc=month_start
+    )
+    assert count_now == 1
+
+
+def test_usage_writer_retries_and_salvages_failed_batches(monkeypatch) -> None:
+    written: list[tuple] = []
+    calls = 0
+
+    def insert(rows):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise sqlite3.OperationalError("database is locked")
+        if any(row[0] == -1 for row in rows):
+            raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+        written.extend(rows)
+
+    monkeypatch.setattr(billing_store, "_insert_usage_rows", insert)
+    monkeypatch.setattr(billing_store, "USAGE_WRITE_RETRY_SECONDS", 0)
+    row = (1, 1, "html_file", 1, 200, 10, "2026-01-01T00:00:00+00:00")
+    bad_row = (-1, *row[1:])
+
+    asyncio.run(billing_store._write_usage_batch([row, row]))
+    asyncio.run(billing_store._write_usage_batch([row, bad_row, row]))
+
+    assert written == [row] * 4
+
+
+def test_usage_writer_survives_unexpected_errors(monkeypatch) -> None:
+    async def explode(batch):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(billing_store, "_write_usage_batch", explode)
+    monkeypatch.setattr(billing_store, "USAGE_FLUSH_INTERVAL_SECONDS", 0)
+
+    async def run() -> bool:
+        queue: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(billing_store._usage_writer(queue, asyncio.Condition()))
+        for _ in range(2):
+            queue.put_nowait(("row",))
+            await asyncio.wait_for(queue.join(), timeout=1)
+        alive = not writer.done()
+        writer.cancel()
+        return alive
+
+    assert asyncio.run(run())
+
+
+def test_flush_usage_events_returns_under_steady_traffic(monkeypatch) -> None:
+    written: list[tuple] = []
+    monkeypatch.setattr(billing_store, "_insert_usage_rows", written.extend)
+    monkeypatch.setattr(billing_store, "USAGE_FLUSH_INTERVAL_SECONDS", 0.01)
+    # Run a private writer on this test's loop, leaving the app's writer untouched.
+    for name in ("_usage_loop", "_usage_queue", "_usage_writer_task", "_usage_progress"):
+        monkeypatch.setattr(billing_store, name, None)
+
+    async def record() -> None:
+        await billing_store.record_usage_event(
+            api_key_id=1,
+            account_id=1,
+            request_mode="html_file",
+            success=False,
+            status_code=500,
+            pdf_bytes=0,
+        )
+
+    async def run() -> tuple[int, int]:
+        billing_store.start_usage_writer()
+        stop = asyncio.Event()
+
+        async def traffic() -> None:
+            while not stop.is_set():
+                await record()
+                await asyncio.sleep(0)
+
+        producer = asyncio.create_task(traffic())
+        try:
+            await asyncio.sleep(0.02)
+            queued_before_flush = billing_store._usage_enqueued
+            # The queue never drains while traffic keeps flowing; the flush must not wait for it.
+            await asyncio.wait_for(billing_store.flush_usage_events(), timeout=1)
+            return queued_before_flush, len(written)
+        finally:
+            stop.set()
+            await producer
+            await billing_store.stop_usage_writer()
+
+    queued_before_flush, written_after_flush = asyncio.run(run())
+
+    assert written_after_flush >= queued_before_flush > 0
@@ -2,12 +2,8 @@ from __future__ import annotations
 
 from fastapi.testclient import TestClient
 
-from app.main import app
 
-client = TestClient(app)
-
-
-def test_welcome_page_loads() -> None:
+def test_welcome_page_loads(client: TestClient) -> None:
     response = client.get("/")
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]
@@ -15,13 +11,13 @@ def test_welcome_page_loads() -> None:
     assert "/swagger" in response.text
 
 
-def test_swagger_page_loads() -> None:
+def test_swagger_page_loads(client: TestClient) -> None:
     response = client.get("/swagger")
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]
 
 
-def test_openapi_schema_contains_generate_route() -> None:
+def test_openapi_schema_contains_generate_route(client: TestClient) -> None:
     response = client.get("/openapi.json")
     assert response.status_code == 200
     body = response.json()
@@ -1,15 +1,16 @@
 from __future__ import annotations
 
+import asyncio
+
 from fastapi.testclient import TestClient
 
 from app.api import routes
-from app.main import app
-
-client = TestClient(app)
+from app.services.billing_store import create_api_key_for_account
+from app.services.pdf_cache import MemoryPDFCache, PDFCache
 
 
-def test_generate_pdf_from_raw_html(monkeypatch, api_key: str) -> None:
-    async def fake_generate_pdf(html: str) -> bytes:
+def test_generate_pdf_from_raw_html(client: TestClient, monkeypatch, api_key: str) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
         assert "Hello PDF" in html
         assert "color: red" in html
         return b"%PDF-1.7\nfake"
@@ -29,11 +30,13 @@ def test_generate_pdf_from_raw_html(monkeypatch, api_key: str) -> None:
     assert response.status_code == 200
     assert response.headers["content-type"] == "application/pdf"
     assert "hello.pdf" in response.headers["content-disposition"]
+    assert response.headers["content-length"] == str(len(b"%PDF-1.7\nfake"))
+    assert "transfer-encoding" not in response.headers
     assert response.content.startswith(b"%PDF")
 
 
-def test_generate_pdf_from_template(monkeypatch, api_key: str) -> None:
-    async def fake_generate_pdf(html: str) -> bytes:
+def test_generate_pdf_from_template(client: TestClient, monkeypatch, api_key: str) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
         assert "Acme Corp" in html
         return b"%PDF-1.7\ntemplate"
 
@@ -66,7 +69,7 @@ def test_generate_pdf_from_template(monkeypatch, api_key: str) -> None:
     assert response.content.startswith(b"%PDF")
 
 
-def test_generate_rejects_non_object_data_file(api_key: str) -> None:
+def test_generate_rejects_non_object_data_file(client: TestClient, api_key: str) -> None:
     response = client.post(
         "/generate",
         files=[
@@ -79,7 +82,7 @@ def test_generate_rejects_non_object_data_file(api_key: str) -> None:
     assert "json object" in response.json()["detail"].lower()
 
 
-def test_generate_rejects_invalid_json_in_data_file(api_key: str) -> None:
+def test_generate_rejects_invalid_json_in_data_file(client: TestClient, api_key: str) -> None:
     response = client.post(
         "/generate",
         files=[
@@ -92,13 +95,26 @@ def test_generate_rejects_invalid_json_in_data_file(api_key: str) -> None:
     assert "valid json" in response.json()["detail"].lower()
 
 
-def test_generate_requires_exactly_one_render_file(api_key: str) -> None:
+def test_generate_rejects_non_utf8_json_in_data_file(client: TestClient, api_key: str) -> None:
+    response = client.post(
+        "/generate",
+        files=[
+            ("template_file", ("invoice.html", "<h1>{{ customer_name }}</h1>", "text/html")),
+            ("data_file", ("data.json", b'{"customer_name": "\xff"}', "application/json")),
+        ],
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 422
+    assert "valid json" in response.json()["detail"].lower()
+
+
+def test_generate_requires_exactly_one_render_file(client: TestClient, api_key: str) -> None:
     response = client.post("/generate", data={"filename": "x"}, headers={"X-API-Key": api_key})
     assert response.status_code == 422
     assert "exactly one" in response.json()["detail"].lower()
 
 
-def test_generate_rejects_two_render_files(api_key: str) -> None:
+def test_generate_rejects_two_render_files(client: TestClient, api_key: str) -> None:
     response = client.post(
         "/generate",
         files=[
@@ -109,3 +125,309 @@ def test_generate_rejects_two_render_files(api_key: str) -> None:
     )
     assert response.status_code == 422
     assert "exactly one" in response.json()["detail"].lower()
+
+
+def test_generate_rejects_oversized_upload(client: TestClient, monkeypatch, api_key: str) -> None:
+    monkeypatch.setattr(routes, "MAX_UPLOAD_BYTES", 16)
+
+    response = client.post(
+        "/generate",
+        files=[("html_file", ("input.html", "<h1>" + "x" * 64 + "</h1>", "text/html"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 413
+    assert "html_file" in response.json()["detail"]
+
+
+def test_generate_rejects_non_utf8_upload(client: TestClient, api_key: str) -> None:
+    response = client.post(
+        "/generate",
+        files=[("html_file", ("input.html", b"<h1>\xff\xfe</h1>", "text/html"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 422
+    assert "utf-8" in response.json()["detail"].lower()
+
+
+def test_generate_reuses_compiled_uploaded_template(
+    client: TestClient, monkeypatch, api_key: str
+) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        return b"%PDF-1.7\ntemplate"
+
+    compile_calls: list[str] = []
+    original_compile = routes.pdf_service.compile_template
+
+    def counting_compile(template_content: str):
+        # Compilation must happen in a worker thread, not on the event loop.
+        assert asyncio._get_running_loop() is None
+        compile_calls.append(template_content)
+        return original_compile(template_content)
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+    monkeypatch.setattr(routes.pdf_service, "compile_template", counting_compile)
+    monkeypatch.setattr(routes, "_template_cache", routes.OrderedDict())
+
+    for customer_name in ("Acme Corp", "Globex"):
+        response = client.post(
+            "/generate",
+            files=[
+                ("template_file", ("invoice.html", "<h1>{{ customer_name }}</h1>", "text/html")),
+                (
+                    "data_file",
+                    ("data.json", f'{{"customer_name":"{customer_name}"}}', "application/json"),
+                ),
+            ],
+            headers={"X-API-Key": api_key},
+        )
+        assert response.status_code == 200
+
+    assert compile_calls == ["<h1>{{ customer_name }}</h1>"]
+
+
+def test_generate_rejects_invalid_template_syntax(client: TestClient, api_key: str) -> None:
+    response = client.post(
+        "/generate",
+        files=[("template_file", ("invoice.html", "<h1>{{ customer_name </h1>", "text/html"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 422
+    assert "could not be rendered" in response.json()["detail"].lower()
+
+
+def test_generate_rejects_oversized_request_body(
+    client: TestClient, monkeypatch, api_key: str
+) -> None:
+    monkeypatch.setattr(routes, "MAX_TOTAL_UPLOAD_BYTES", 64)
+
+    response = client.post(
+        "/generate",
+        files=[("html_file", ("input.html", "<h1>Hello PDF</h1>", "text/html"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 413
+    assert "request body" in response.json()["detail"].lower()
+
+
+def test_oversized_request_body_is_rejected_before_it_is_read(monkeypatch) -> None:
+    monkeypatch.setattr(routes, "MAX_TOTAL_UPLOAD_BYTES", 64)
+    sent: list[dict] = []
+
+    async def endpoint(scope, receive, send) -> None:
+        raise AssertionError("the app must not be reached")
+
+    async def receive() -> dict:
+        raise AssertionError("the body must not be read")
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/generate",
+        "headers": [(b"content-length", b"65")],
+    }
+    asyncio.run(routes.UploadSizeLimitMiddleware(endpoint)(scope, receive, send))
+
+    assert sent[0]["status"] == 413
+
+
+def test_generate_rejects_unexpected_file_extension(client: TestClient, api_key: str) -> None:
+    response = client.post(
+        "/generate",
+        files=[("html_file", ("input.pdf", "<h1>Hello PDF</h1>", "application/pdf"))],
+        headers={"X-API-Key": api_key},
+    )
+    assert response.status_code == 422
+    assert "html_file" in response.json()["detail"]
+
+
+def test_generate_serves_repeated_render_from_cache(
+    client: TestClient, monkeypatch, tmp_path, api_key: str
+) -> None:
+    render_calls: list[str] = []
+
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        render_calls.append(html)
+        return b"%PDF-1.7\ncached"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+    monkeypatch.setattr(routes, "pdf_cache", PDFCache(tmp_path))
+
+    def post_invoice(data_json: str):
+        return client.post(
+            "/generate",
+            files=[
+                ("template_file", ("invoice.html", "<h1>{{ customer_name }}</h1>", "text/html")),
+                ("data_file", ("data.json", data_json, "application/json")),
+            ],
+            headers={"X-API-Key": api_key},
+        )
+
+    first = post_invoice('{"customer_name":"Acme Corp","invoice_number":"INV-1"}')
+    second = post_invoice('{"invoice_number":"INV-1","customer_name":"Acme Corp"}')
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert first.headers["etag"] == second.headers["etag"]
+    assert second.content == b"%PDF-1.7\ncached"
+    assert second.headers["content-disposition"] == first.headers["content-disposition"]
+    assert second.headers["content-length"] == str(len(b"%PDF-1.7\ncached"))
+    assert len(render_calls) == 1
+
+
+def test_generate_cache_is_not_shared_between_accounts(
+    client: TestClient, monkeypatch, tmp_path, api_key: str
+) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+    monkeypatch.setattr(routes, "pdf_cache", PDFCache(tmp_path))
+    other_key = create_api_key_for_account(account_name="Other Account", plan="pro")
+    files = [("html_file", ("input.html", "<h1>Shared document</h1>", "text/html"))]
+
+    first = client.post("/generate", files=files, headers={"X-API-Key": api_key})
+    other = client.post("/generate", files=files, headers={"X-API-Key": other_key})
+
+    assert first.headers["x-cache"] == other.headers["x-cache"] == "MISS"
+    assert first.headers["etag"] != other.headers["etag"]
+
+
+def test_generate_honours_if_none_match(client: TestClient, monkeypatch, api_key: str) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+    files = [("html_file", ("input.html", "<h1>Hello PDF</h1>", "text/html"))]
+
+    first = client.post("/generate", files=files, headers={"X-API-Key": api_key})
+    assert first.status_code == 200
+
+    second = client.post(
+        "/generate",
+        files=files,
+        headers={"X-API-Key": api_key, "If-None-Match": first.headers["etag"]},
+    )
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_generate_rejects_wildcard_if_none_match(
+    client: TestClient, monkeypatch, api_key: str
+) -> None:
+    render_calls: list[str] = []
+
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        render_calls.append(html)
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+
+    response = client.post(
+        "/generate",
+        files=[("html_file", ("input.html", "<h1>Never rendered</h1>", "text/html"))],
+        headers={"X-API-Key": api_key, "If-None-Match": "*"},
+    )
+    usage = client.get(
+        "/admin/usage",
+        headers={"X-Admin-Token": "test-admin-token"},
+        params={"api_key": api_key},
+    )
+
+    assert response.status_code == 412
+    assert render_calls == []
+    assert usage.json()["successful_requests"] == 0
+
+
+def test_generate_forwards_wait_until(client: TestClient, monkeypatch, api_key: str) -> None:
+    seen: list[str] = []
+
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        seen.append(wait_until)
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+
+    files = [("html_file", ("input.html", "<h1>Fonts</h1>", "text/html"))]
+    default = client.post("/generate", files=files, headers={"X-API-Key": api_key})
+    idle = client.post(
+        "/generate",
+        files=files,
+        data={"wait_until": "networkidle"},
+        headers={"X-API-Key": api_key},
+    )
+    invalid = client.post(
+        "/generate",
+        files=files,
+        data={"wait_until": "forever"},
+        headers={"X-API-Key": api_key},
+    )
+
+    assert default.status_code == 200
+    assert idle.status_code == 200
+    assert default.headers["etag"] != idle.headers["etag"]
+    assert invalid.status_code == 422
+    assert seen == ["load", "networkidle"]
+
+
+def test_concurrent_identical_renders_share_one_render(monkeypatch) -> None:
+    render_calls = 0
+
+    async def render() -> bytes:
+        nonlocal render_calls
+        render_calls += 1
+        await asyncio.sleep(0.01)
+        return b"%PDF-1.7\nshared"
+
+    monkeypatch.setattr(routes, "pdf_memory_cache", MemoryPDFCache(1024))
+
+    async def run() -> list[tuple[str, bytes, object]]:
+        return await asyncio.gather(*(routes._cached_render("digest", render) for _ in range(3)))
+
+    results = asyncio.run(run())
+
+    assert render_calls == 1
+    assert sorted(status for status, _, _ in results) == ["HIT", "HIT", "MISS"]
+    assert {pdf for _, pdf, _ in results} == {b"%PDF-1.7\nshared"}
+
+
+def test_memory_cache_respects_byte_budget() -> None:
+    cache = MemoryPDFCache(10, max_item_bytes=6)
+
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    cache.put("huge", b"1234567")
+    cache.put("c", b"123")
+
+    assert cache.get("a") is None
+    assert cache.get("huge") is None
+    assert cache.get("b") == b"12345"
+    assert cache.get("c") == b"123"
+    assert cache.total_bytes == 8
+
+
+def test_generate_streams_uploads_above_small_upload_size(
+    client: TestClient, monkeypatch, api_key: str
+) -> None:
+    async def fake_generate_pdf(html: str, wait_until: str = "load") -> bytes:
+        assert "Streamed" in html
+        return b"%PDF-1.7\nfake"
+
+    monkeypatch.setattr(routes.pdf_service, "generate_pdf", fake_generate_pdf)
+    monkeypatch.setattr(routes, "SMALL_UPLOAD_BYTES", 0)
+    monkeypatch.setattr(routes, "UPLOAD_CHUNK_BYTES", 4)
+
+    response = client.post(
+        "/generate",
+        files=[
+            ("template_file", ("invoice.html", "<h1>{{ title }} é</h1>", "text/html")),
+            ("data_file", ("data.json", '{"title": "Streamed"}', "application/json")),
+        ],
+        headers={"X-API-Key": api_key},
+    )
+
+    assert response.status_code == 200
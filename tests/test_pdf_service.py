@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from playwright.async_api import Error as PlaywrightError
+
+from app.paths import TEMPLATE_DIR
+from app.services.pdf_service import (
+    DATA_URL_MAX_BYTES,
+    DATA_URL_MIN_BYTES,
+    PDFGenerationError,
+    PDFService,
+)
+
+
+class FakePage:
+    def __init__(self, context: FakeContext) -> None:
+        self.context = context
+        context.pages.append(self)
+
+    async def set_content(self, html: str, **_: object) -> None:
+        if "crash" in html:
+            raise PlaywrightError("renderer crashed")
+        if "popup" in html:
+            popup = FakePage(self.context)
+            # "silent" simulates a popup whose page event has not been handled yet.
+            if "silent" not in html:
+                for handler in self.context.handlers:
+                    await handler(popup)
+        self.context.browser.loads.append(f"set_content:{len(self.context.pages)}")
+
+    async def goto(self, url: str, **_: object) -> None:
+        if url != "about:blank":
+            self.context.browser.loads.append(url.split(",", 1)[0])
+
+    async def emulate_media(self, **_: object) -> None:
+        self.context.browser.emulations += 1
+
+    async def pdf(self, **_: object) -> bytes:
+        await asyncio.sleep(0)
+        return b"%PDF-1.4 fake"
+
+    async def close(self) -> None:
+        self.context.pages.remove(self)
+
+
+class FakeContext:
+    def __init__(self, browser: FakeBrowser) -> None:
+        self.browser = browser
+        self.closed = False
+        self.pages: list[FakePage] = []
+        self.handlers: list = []
+
+    def on(self, event: str, handler) -> None:
+        assert event == "page"
+        self.handlers.append(handler)
+
+    async def new_page(self) -> FakePage:
+        return FakePage(self)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self) -> None:
+        self.contexts: list[FakeContext] = []
+        self.loads: list[str] = []
+        self.emulations = 0
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def new_context(self, **_: object) -> FakeContext:
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self) -> None:
+        pass
+
+
+def test_generate_pdf_renders_each_job_in_a_fresh_context() -> None:
+    service = PDFService(template_dir=TEMPLATE_DIR, max_concurrency=2)
+    browser = FakeBrowser()
+    service._browser = browser
+
+    async def run() -> list[bytes]:
+        await service.startup()
+        try:
+            return await asyncio.gather(*(service.generate_pdf("<p>x</p>") for _ in range(6)))
+        finally:
+            await service.shutdown()
+
+    results = asyncio.run(run())
+
+    assert results == [b"%PDF-1.4 fake"] * 6
+    assert browser.loads == ["set_content:1"] * 6
+    assert browser.emulations == 6
+    # Nothing (cookies, storage, cache) can carry over: one context per render, all closed.
+    assert len(browser.contexts) == 6
+    assert all(context.closed for context in browser.contexts)
+
+
+def test_generate_pdf_failure_replaces_the_worker_page() -> None:
+    service = PDFService(template_dir=TEMPLATE_DIR, max_concurrency=1)
+    browser = FakeBrowser()
+    service._browser = browser
+
+    async def run() -> bytes:
+        try:
+            with pytest.raises(PDFGenerationError):
+                await service.generate_pdf("<p>crash</p>")
+            return await service.generate_pdf("<p>ok</p>")
+        finally:
+            await service.shutdown()
+
+    assert asyncio.run(run()) == b"%PDF-1.4 fake"
+    assert [context.closed for context in browser.contexts] == [True, True]
+
+
+def test_popups_do_not_survive_into_the_next_render() -> None:
+    service = PDFService(template_dir=TEMPLATE_DIR, max_concurrency=1)
+    browser = FakeBrowser()
+    service._browser = browser
+
+    async def run() -> None:
+        try:
+            for html in ("<p>popup</p>", "<p>silent popup</p>", "<p>next tenant</p>"):
+                await service.generate_pdf(html)
+        finally:
+            await service.shutdown()
+
+    asyncio.run(run())
+
+    # Handled popups close as they open; any that slip through go down with their context.
+    assert browser.loads == ["set_content:1", "set_content:2", "set_content:1"]
+    assert len(browser.contexts) == 3
+    assert all(context.closed for context in browser.contexts)
+
+
+def test_inject_css_matches_head_case_insensitively() -> None:
+    html = "<HTML><HEAD><title>x</title></HEAD ><body></body></HTML>"
+
+    assert PDFService._inject_css(html=html, css="p {}") == (
+        "<HTML><HEAD><title>x</title><style>p {}</style></HEAD ><body></body></HTML>"
+    )
+    assert PDFService._inject_css(html="<html lang='en'><p>x</p></html>", css="p {}") == (
+        "<html lang='en'><head><style>p {}</style></head><p>x</p></html>"
+    )
+    assert PDFService._inject_css(html="<p>x</p><!-- </head> -->", css="p {}") == (
+        "<html><head><style>p {}</style></head><body><p>x</p><!-- </head> --></body></html>"
+    )
+    bom_document = "\ufeff<!DOCTYPE html><html><head></head><body></body></html>"
+    assert PDFService._inject_css(html=bom_document, css="p {}") == (
+        "\ufeff<!DOCTYPE html><html><head><style>p {}</style></head><body></body></html>"
+    )
+
+
+def test_build_html_reuses_named_template() -> None:
+    service = PDFService(template_dir=TEMPLATE_DIR)
+    assert service.warm_templates() == len(service.env.list_templates())
+
+    for _ in range(2):
+        service.build_html(html=None, css=None, template_name="invoice.html", data={})
+
+    assert service._get_template.cache_info().hits == 2
+
+
+def test_generate_pdf_loads_large_html_via_data_url() -> None:
+    service = PDFService(template_dir=TEMPLATE_DIR)
+    browser = FakeBrowser()
+    service._browser = browser
+    large = "<p>" + "x" * DATA_URL_MIN_BYTES + "</p>"
+    huge = "<p>" + "x" * DATA_URL_MAX_BYTES + "</p>"
+
+    async def run() -> None:
+        try:
+            for html in ("<p>small</p>", large, huge):
+                await service.generate_pdf(html)
+        finally:
+            await service.shutdown()
+
+    asyncio.run(run())
+
+    assert browser.loads == [
+        "set_content:1",
+        "data:text/html;charset=utf-8;base64",
+        "set_content:1",
+    ]
+
+
+def test_templates_added_after_startup_are_still_found(tmp_path) -> None:
+    (tmp_path / "shipped.html").write_text("<p>{{ name }}</p>", encoding="utf-8")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\xff\xfe")
+    service = PDFService(template_dir=tmp_path)
+    assert service.warm_templates() == 1
+    (tmp_path / "added.html").write_text("<b>{{ name }}</b>", encoding="utf-8")
+    (tmp_path / "shipped.html").unlink()
+
+    render = service.build_html
+    assert render(html=None, css=None, template_name="shipped.html", data={"name": "A"}) == (
+        "<p>A</p>"
+    )
+    assert render(html=None, css=None, template_name="added.html", data={"name": "B"}) == (
+        "<b>B</b>"
+    )